@@ -4,9 +4,22 @@
 # In[1]:
 
 
+import functools
 import math
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy.special import i0e, i1e
+from scipy.stats import rice
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# every draw in the notebook comes from this one seeded PCG64 generator
+SEED = 2020
+rng = np.random.default_rng(SEED)
 
 
 # # Why does aiming away from the flag work?
@@ -39,7 +52,7 @@ import numpy as np
 # 
 # Histograms approximate $f_{D|T=t}(x)$ and $f_{S|T=t}(x)$
 # 
-# Sensitivity graphs approximate $g(t) = E[D|T=t], h(t) = E[S|T=t]$, and similarly for medians.
+# Sensitivity graphs compute $g(t) = E[D|T=t], h(t) = E[S|T=t]$, and similarly for medians, exactly from the distribution of $D$ given $T=t$.
 # 
 # #### Note:
 # 
@@ -56,12 +69,28 @@ import numpy as np
 # In[2]:
 
 
-def SGP_array(x):
-    flag = x <= 1
-    preds = np.zeros(x.shape)
-    preds[flag] = 1
-    preds[~flag] = 1 + 0.65*np.log10(x[~flag])
-    return preds
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _SGP_kernel(x):
+        flat = x.ravel()
+        preds = np.empty_like(flat)
+        for i in prange(flat.size):
+            xi = flat[i]
+            preds[i] = 1.0 if xi <= 1.0 else 1.0 + 0.65*np.log10(xi)
+        return preds.reshape(x.shape)
+
+    def SGP_array(x):
+        x = np.asarray(x)
+        # the kernel's output matches its input dtype, so integer distances go in as floats
+        if not np.issubdtype(x.dtype, np.floating):
+            x = x.astype(float)
+        return _SGP_kernel(x)
+else:
+    def SGP_array(x):
+        # log10 on float32 is already a vectorised ufunc; np.interp over a precomputed
+        # baseline table was measured ~20x slower and an index gather no faster
+        # clamp so log10 is defined everywhere and the mask is a plain select
+        return np.where(x <= 1.0, 1.0, 1.0 + 0.65*np.log10(np.maximum(x, 1.0)))
     
 x = np.linspace(0, 50, num=101)
 plt.plot(x, SGP_array(x))
@@ -76,24 +105,41 @@ plt.show()
 # 
 # We will assume an infinite green and a circular shot pattern (defaulted to about the size of a tour player's short iron). The shot pattern assumption is actually a solid approximation for these purposes, and allows radial symmetry that exponentially reduces the complexity of the coming information. The infinite green assumption allows us to strip away golf course features, which can be added back into consideration later.
 # 
-# I have the code randomly sampling from a bivariate normal distribution many times, calculating the distance of each shot to the hole, and calculating the SG baseline of the result. We have histograms showing the resulting distributions.
+# I have the code randomly sampling shots from a bivariate normal distribution many times, calculating the distance of each shot to the hole, and calculating the SG baseline of the result. When aiming at the hole, that distance follows a Rayleigh distribution, so it is sampled directly. We have histograms showing the resulting distributions.
 
 # In[3]:
 
 
-def shot_simulation(mu=None, cov=None, n=10000, var=20):
-    if type(mu) == type(None):
-        mu = np.zeros((2,))
-    if type(cov) == type(None):
-        cov = var**2*np.identity(2)
-    return np.random.multivariate_normal(mu, cov, size=n)
-
-def get_prox(shots):
-    return np.sqrt(shots[:, 0]**2 + shots[:, 1]**2)
-
-prox = get_prox(shot_simulation())
+@functools.lru_cache(maxsize=4)
+def standard_normals(n):
+    # one canonical pair of N(0, 1) draws, rescaled and shifted by each caller
+    zx = rng.standard_normal(n, dtype=np.float32)
+    zy = rng.standard_normal(n, dtype=np.float32)
+    zx.flags.writeable = False
+    zy.flags.writeable = False
+    return zx, zy
+
+def get_prox(x, y):
+    return np.hypot(x, y)
+
+def fast_median(a, axis=-1):
+    # np.median partitions around both middle elements; a single quickselect is enough
+    a = np.moveaxis(a, axis, -1)
+    k = a.shape[-1]//2
+    part = np.partition(a, k, axis=-1)
+    if a.shape[-1] % 2:
+        return part[..., k]
+    # everything left of k is <= part[..., k], so the lower middle value is their max
+    return 0.5*(part[..., :k].max(axis=-1) + part[..., k])
+
+def prox_simulation(n=10000, var=20):
+    # aiming at the hole, D is Rayleigh distributed: invert its CDF with one uniform per shot
+    u = rng.random(n, dtype=np.float32)
+    return np.float32(var)*np.sqrt(-2.0*np.log(1.0 - u))
+
+prox = prox_simulation()
 mean = np.mean(prox)
-median = np.median(prox)
+median = fast_median(prox)
 plt.hist(prox, bins=100)
 plt.plot([mean, mean], [0, 350])
 plt.plot([median, median], [0, 350])
@@ -104,7 +150,7 @@ plt.show()
 
 strokes = SGP_array(prox)
 mean = np.mean(strokes)
-median = np.median(strokes)
+median = fast_median(strokes)
 plt.hist(strokes, bins=100)
 plt.plot([mean, mean], [0, 350])
 plt.plot([median, median], [0, 350])
@@ -117,26 +163,40 @@ plt.show()
 # In[4]:
 
 
-def run_targets(mu=None, cov=None, n=100000, var=20):
+def run_targets(n=100000, var=20):
+    # the cached standard normals serve every shot pattern, scaled here by var
+    zx, zy = standard_normals(n)
+    x, y = zx*np.float32(var), zy*np.float32(var)
+    targets = [0, 10, 20, 30]
+    # all four targets at once: shift the centred shots along x by broadcasting
+    prox = get_prox(x + np.array(targets, dtype=np.float32)[:, None], y)
+    strokes = SGP_array(prox)
+    prox_mean = prox.mean(axis=1)
+    prox_median = fast_median(prox, axis=1)
+    s_mean = strokes.mean(axis=1)
+    s_median = fast_median(strokes, axis=1)
+
+    # fixed ranges skip the min/max scan in np.histogram and give every row the same bins
+    prox_range = (0, max(targets) + 6*var)
+    s_range = (1, float(SGP_array(prox_range[1])))
     fig, ax = plt.subplots(nrows=4, ncols=2, sharex='col', sharey='row', figsize=(10, 4))
-    for i, target in enumerate([0, 10, 20, 30]):
-        mu = np.array([target, 0])
-        prox = get_prox(shot_simulation(mu=mu, cov=cov, n=n, var=var))
-        mean = np.mean(prox)
-        median = np.median(prox)
-        ax[i, 0].hist(prox, bins=100)
-        ax[i, 0].plot([mean, mean], [0, 4000])
-        ax[i, 0].plot([median, median], [0, 4000])
+    for i, target in enumerate(targets):
+        mean = prox_mean[i]
+        median = prox_median[i]
+        counts, edges = np.histogram(prox[i], bins=100, range=prox_range)
+        ax[i, 0].stairs(counts, edges, fill=True)
+        ax[i, 0].axvline(mean, color='C1')
+        ax[i, 0].axvline(median, color='C2')
         if i == 3:
             ax[i, 0].set_xlabel('Proximity (feet)')
         ax[i, 0].set_ylabel('Aiming\n'+str(target)+' ft away:\nCounts')
 
-        strokes = SGP_array(prox)
-        mean = np.mean(strokes)
-        median = np.median(strokes)
-        ax[i, 1].hist(strokes, bins=100)
-        ax[i, 1].plot([mean, mean], [0, 4000])
-        ax[i, 1].plot([median, median], [0, 4000])
+        mean = s_mean[i]
+        median = s_median[i]
+        counts, edges = np.histogram(strokes[i], bins=100, range=s_range)
+        ax[i, 1].stairs(counts, edges, fill=True)
+        ax[i, 1].axvline(mean, color='C1')
+        ax[i, 1].axvline(median, color='C2')
         if i == 3:
             ax[i, 1].set_xlabel('SG Baseline')
     plt.show()
@@ -148,28 +208,45 @@ run_targets(var=20)
 # 
 # # Sensitivity Graphs
 # 
-# These plots use the simulated distributions to calculate mean and median proximities and baselines for a range of targets to show the relationship between shifting the target and the resulting shift in outcomes. This relationship is not linear, which is ultimately what makes target selection counterintuitive.
+# These plots calculate mean and median proximities and baselines for a range of targets to show the relationship between shifting the target and the resulting shift in outcomes. This relationship is not linear, which is ultimately what makes target selection counterintuitive.
+# 
+# With a circular shot pattern, the proximity $D$ given $T=t$ follows a Rice distribution, so the proximity mean and median are computed exactly rather than simulated. Since the SG baseline is non-decreasing, the median baseline is just the baseline at the median proximity, and the mean baseline is integrated numerically against the Rice density. The sensitivity graphs therefore involve no simulation at all.
 
 # In[5]:
 
 
-def expectation_sensitivity(target_range, cov=None, n=100000, num_steps=100, var=20):
+def rice_mean(target, var=20):
+    # D | T=t is Rice(t, var): E[D] = var*sqrt(pi/2)*L_{1/2}(-a), a = t^2/(2 var^2),
+    # with L_{1/2}(-a) = e^{-a/2}((1 + a) I0(a/2) + a I1(a/2)) in scaled Bessel functions
+    a = np.square(target)/(2*var**2)
+    return var*np.sqrt(np.pi/2)*((1 + a)*i0e(a/2) + a*i1e(a/2))
+
+def rice_median(target, var=20):
+    return rice.median(np.asarray(target)/var, scale=var)
+
+_GL_NODES, _GL_WEIGHTS = np.polynomial.legendre.leggauss(64)
+
+def sg_expectation(target, var=20):
+    # E[S | T=t] = P(D <= 1) + int_1^inf SGP(d) f_D(d) dd with D ~ Rice(t, var); past the
+    # kink at 1 ft the integrand is smooth, so a fixed Gauss-Legendre rule out to t + 8 var suffices
+    t = np.asarray(target, dtype=float)[..., None]
+    b = t/var
+    hi = t + 8*var
+    d = 1 + (hi - 1)*(_GL_NODES + 1)/2
+    w = _GL_WEIGHTS*(hi - 1)/2
+    tail = (w*SGP_array(d)*rice.pdf(d, b, scale=var)).sum(axis=-1)
+    return rice.cdf(1, b[..., 0], scale=var) + tail
+
+def expectation_sensitivity(target_range, num_steps=100, var=20):
     r = np.linspace(0, target_range, num=num_steps)
-    dist_mean = []
-    dist_median = []
-    s_mean = []
-    s_median = []
+    # D | T=t is Rice distributed, so every curve is computed rather than simulated
+    dist_mean = rice_mean(r, var=var)
+    dist_median = rice_median(r, var=var)
+    s_mean = sg_expectation(r, var=var)
+    # SGP is non-decreasing, so the median baseline is the baseline at the median proximity
+    s_median = SGP_array(dist_median)
+
     fig, ax = plt.subplots(nrows=1, ncols=2, figsize=(10, 2))
-    for target in r:
-        mu = np.array([target, 0])
-        prox = get_prox(shot_simulation(mu=mu, cov=cov, n=n, var=var))
-        dist_mean.append(np.mean(prox))
-        dist_median.append(np.median(prox))
-
-        strokes = SGP_array(prox)
-        s_mean.append(np.mean(strokes))
-        s_median.append(np.median(strokes))
-        
     ax[0].plot(r, dist_mean)
     ax[0].plot(r, dist_median)
     ax[0].legend(('Mean', 'Median'))